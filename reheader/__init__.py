@@ -4,4 +4,8 @@ __author__ = '18F'
 __email__ = 'catherine.devlin@gsa.gov'
 __version__ = '0.1.0'
 
-from .reheader import reheadered
+from .reheader import (reheadered, ConversionErrors, Preflight, RowView,
+                       ValidationError, ValidationReport)
+from .files import (preflight, preflight_many, reheader_file, reheader_jsonl,
+                    write_jsonl)
+from .sinks import load_sqlite
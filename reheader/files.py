@@ -0,0 +1,557 @@
+# -*- coding: utf-8 -*-
+"""
+Reheader delimited text and JSON Lines files straight from disk.
+
+A file is read front to back exactly once: a bounded byte sample from the
+start decides encoding and CSV dialect, and is then parsed as the first
+rows of the stream (which is also what header-row detection looks at)
+before the rest of the file is read in large chunks.  Gzip, bzip2 and xz
+files are recognized by their magic bytes and decompressed on the fly.
+"""
+
+import bz2
+import codecs
+import collections
+import contextlib
+import csv
+import gzip
+import io
+import itertools
+import json
+import os
+import queue
+import threading
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+
+from .reheader import (MINIMUM_SCORE, OPTIONAL_PREFIX, Preflight,
+                       _headers_present, _preflight_rows, reheadered)
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+SAMPLE_SIZE = 64 * 1024
+CHUNK_SIZE = 1024 * 1024
+DELIMITERS = ',\t;|'
+FALLBACK_ENCODINGS = ('utf-8', 'cp1252')
+CHECKPOINT_EVERY = 100000
+WRITE_BATCH_SIZE = 1000
+PREFLIGHT_ROWS = 10
+PREFLIGHT_WORKERS = 8
+QUEUE_SIZE = 8
+# reheadered() arguments a checkpoint's decisions depend on, with defaults
+_MAPPING_OPTIONS = {'header_present': None,
+                    'keep_extra': False,
+                    'minimum_score': MINIMUM_SCORE,
+                    'optional_prefix': OPTIONAL_PREFIX,
+                    'prefer_fuzzy': False}
+_DIALECT_ATTRIBUTES = ('delimiter', 'doublequote', 'escapechar',
+                       'lineterminator', 'quotechar', 'quoting',
+                       'skipinitialspace', 'strict')
+
+# UTF-32 first: its little-endian BOM begins with the UTF-16 one
+_BOMS = ((codecs.BOM_UTF32_LE, 'utf-32'),
+         (codecs.BOM_UTF32_BE, 'utf-32'),
+         (codecs.BOM_UTF8, 'utf-8-sig'),
+         (codecs.BOM_UTF16_LE, 'utf-16'),
+         (codecs.BOM_UTF16_BE, 'utf-16'), )
+
+_DECOMPRESSORS = [(b'\x1f\x8b', gzip.open),
+                  (b'BZh', bz2.open), ]
+if lzma:
+    _DECOMPRESSORS.append((b'\xfd7zXZ\x00', lzma.open))
+_MAGIC_LENGTH = 6
+_DONE = object()
+
+
+def reheader_file(path,
+                  desired_headers,
+                  sample_size=SAMPLE_SIZE,
+                  encoding=None,
+                  dialect=None,
+                  checkpoint=None,
+                  checkpoint_every=CHECKPOINT_EVERY,
+                  background=False,
+                  queue_size=QUEUE_SIZE,
+                  **kwargs):
+    """Re-emit the rows of a delimited text file with altered headers.
+
+    Args:
+        path (str): File to read; may be gzip, bzip2 or xz compressed.
+        desired_headers (dict or list): As for ``reheadered``.
+        sample_size (int): Bytes read up front to detect encoding and
+            dialect.  Default 64 KiB.
+        encoding (str): Skip encoding detection and use this codec.
+        dialect (csv.Dialect): Skip dialect sniffing and use this dialect.
+        checkpoint (str): Path of a progress file.  Every
+            ``checkpoint_every`` rows consumed, the input byte offset, rows
+            emitted, encoding, dialect, header decision and mapping are
+            saved there.  If it already exists, reading resumes after the
+            last saved row with the saved decisions; it is removed once the
+            whole file has been read.  A checkpoint written for another
+            file, another version of the file, or other headers or matching
+            options raises ``ValueError``.
+        checkpoint_every (int): Rows between checkpoints.  Default 100000.
+            With compressed input the offset counts decompressed bytes,
+            and resuming decompresses everything before it again.
+        background (bool): Read (and decompress) the file on a background
+            thread, into a queue of at most ``queue_size`` large chunks.
+            Default ``False``; any throughput gain is unbenchmarked.
+        queue_size (int): Chunks the background thread may read ahead.
+
+    Other keyword arguments are passed on to ``reheadered``.
+
+    Returns:
+        iterator of dicts with altered keys.
+    """
+    if checkpoint is None:
+        progress = None
+    else:
+        source = _checkpoint_source(path, desired_headers, kwargs)
+        progress = _load_checkpoint(checkpoint, source)
+    with _open(path) as infile:
+        if progress:
+            infile.seek(progress['offset'])
+            sample = b''
+        else:
+            sample = infile.read(sample_size)
+            encoding = encoding or detect_encoding(sample)
+            progress = {'offset': 0,
+                        'rows_emitted': 0,
+                        'encoding': encoding,
+                        'dialect': _fmtparams(
+                            dialect or sniff_dialect(sample, encoding)),
+                        'resolved': {}}
+            if checkpoint is not None:
+                progress['source'] = source
+        chunks = _reader(infile, sample, background, queue_size)
+        try:
+            if checkpoint is None:
+                rows = csv.reader(_text_lines(chunks, progress['encoding']),
+                                  **progress['dialect'])
+                for row in reheadered(rows, desired_headers, **kwargs):
+                    yield row
+                return
+            for row in _checkpointed(chunks, progress, desired_headers,
+                                     checkpoint, checkpoint_every, kwargs):
+                yield row
+        finally:
+            # stops any background reader before the file is closed
+            chunks.close()
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+
+def reheader_jsonl(source,
+                   desired_headers,
+                   output=None,
+                   background=False,
+                   queue_size=QUEUE_SIZE,
+                   **kwargs):
+    """Re-emit the records of a JSON Lines file with altered keys.
+
+    The mapping is resolved from the keys of the first records; every
+    line is parsed once and translated by the same compiled row function.
+    Keys missing from a record come out as ``None`` unless
+    ``fill_missing=False`` is passed.
+
+    Args:
+        source (str or file): Path of a (possibly compressed) JSON Lines
+            file, or an open stream of lines.
+        desired_headers (dict or list): As for ``reheadered``.
+        output (str or file): If given, write the altered records there as
+            JSON Lines instead of returning them.
+        background (bool), queue_size (int): As for ``reheader_file``.
+
+    Other keyword arguments are passed on to ``reheadered``.
+
+    Returns:
+        iterator of dicts with altered keys or, when ``output`` is given,
+        the number of records written.
+    """
+    kwargs.setdefault('fill_missing', True)
+    rows = _reheader_jsonl(source, desired_headers, background, queue_size,
+                           kwargs)
+    if output is None:
+        return rows
+    return write_jsonl(rows, output)
+
+
+def write_jsonl(rows, output, batch_size=WRITE_BATCH_SIZE):
+    """Write dicts (or other mappings, such as ``RowView``) to ``output``
+    (a path or text stream) as JSON Lines.
+
+    Lines are joined and written ``batch_size`` at a time.
+
+    Returns:
+        int: number of records written.
+    """
+    if not hasattr(output, 'write'):
+        with io.open(output, 'w', encoding='utf-8') as outfile:
+            return write_jsonl(rows, outfile, batch_size)
+    encode = json.JSONEncoder(ensure_ascii=False, default=_jsonable).encode
+    written = 0
+    batch = []
+    for row in rows:
+        batch.append(encode(row))
+        if len(batch) >= batch_size:
+            output.write(u'\n'.join(batch) + u'\n')
+            written += len(batch)
+            batch = []
+    if batch:
+        output.write(u'\n'.join(batch) + u'\n')
+        written += len(batch)
+    return written
+
+
+def _reheader_jsonl(source, desired_headers, background, queue_size, kwargs):
+    if hasattr(source, 'read'):
+        for row in reheadered(_json_records(source), desired_headers,
+                              **kwargs):
+            yield row
+        return
+    with _open(source) as infile:
+        chunks = _reader(infile, b'', background, queue_size)
+        try:
+            records = _json_records(_split_lines(chunks, b'\n'))
+            for row in reheadered(records, desired_headers, **kwargs):
+                yield row
+        finally:
+            chunks.close()
+
+
+def _jsonable(obj):
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    raise TypeError('Object of type {} is not JSON serializable'.format(
+        type(obj).__name__))
+
+
+def _json_records(lines):
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
+def preflight(source,
+              desired_headers,
+              sample_rows=PREFLIGHT_ROWS,
+              sample_size=SAMPLE_SIZE,
+              encoding=None,
+              dialect=None,
+              **kwargs):
+    """Find what reheadering ``source`` would decide, from its first rows.
+
+    Only the first ``sample_rows`` rows are examined - for a file, parsed
+    from its first ``sample_size`` bytes - to detect whether a header row
+    is present and to match columns, exactly as ``reheadered`` would.
+    Missing required columns are reported rather than raised.
+
+    Args:
+        source (str or iterator): Path of a delimited text or JSON Lines
+            file (possibly compressed), or a series of dicts or lists.
+        desired_headers (dict or list): As for ``reheadered``.
+        sample_rows (int): Rows to examine.  Default 10.
+        sample_size (int), encoding (str), dialect (csv.Dialect): As for
+            ``reheader_file``.
+
+    Other keyword arguments are the matching options of ``reheadered``:
+    ``header_present``, ``keep_extra``, ``minimum_score``,
+    ``optional_prefix`` and ``prefer_fuzzy``.  Any other raises
+    ``TypeError``.
+
+    Returns:
+        Preflight
+    """
+    _check_preflight_options(kwargs)
+    if hasattr(source, 'strip'):
+        rows = _sample_rows(source, sample_size, encoding, dialect)
+    else:
+        rows = iter(source)
+    return _preflight_rows(itertools.islice(rows, sample_rows),
+                           desired_headers, **kwargs)
+
+
+def preflight_many(sources,
+                   desired_headers,
+                   workers=PREFLIGHT_WORKERS,
+                   **kwargs):
+    """``preflight`` many files concurrently, on ``workers`` threads.
+
+    Returns:
+        dict of {<source>: Preflight}.  Sources that could not be read or
+        decoded get a ``Preflight`` with ``error`` set.
+    """
+
+    def check(source):
+        try:
+            return preflight(source, desired_headers, **kwargs)
+        except (OSError, EOFError, UnicodeDecodeError, ValueError,
+                csv.Error) as exc:
+            return Preflight(error=exc)
+
+    _check_preflight_options(kwargs)
+    sources = list(sources)
+    if workers < 2:
+        return {s: check(s) for s in sources}
+    with ThreadPoolExecutor(workers) as pool:
+        return dict(zip(sources, pool.map(check, sources)))
+
+
+def _check_preflight_options(kwargs):
+    unknown = sorted(set(kwargs) - set(_MAPPING_OPTIONS))
+    if unknown:
+        raise TypeError('preflight got unexpected keyword arguments {}'
+                        .format(unknown))
+
+
+def _sample_rows(path, sample_size, encoding, dialect):
+    """Rows parsed from the complete lines of a file's first bytes."""
+    with _open(path) as infile:
+        sample = infile.read(sample_size)
+    encoding = encoding or detect_encoding(sample)
+    lines = codecs.getincrementaldecoder(encoding)().decode(sample).split(
+        u'\n')
+    if len(sample) == sample_size:
+        lines.pop()
+    if u''.join(lines).lstrip()[:1] == u'{':
+        return _json_records(lines)
+    dialect = dialect or sniff_dialect(sample, encoding)
+    return csv.reader([line + u'\n' for line in lines], dialect)
+
+
+def _checkpointed(chunks, progress, desired_headers, checkpoint,
+                  checkpoint_every, kwargs):
+    encoding = progress['encoding']
+    if not _newline_is_byte(encoding):
+        raise ValueError('Cannot checkpoint {} input'.format(encoding))
+    decoder = codecs.getdecoder(encoding)
+    position = [progress['offset']]
+    lines = (decoder(line)[0]
+             for line in _counted(_split_lines(chunks, b'\n'), position))
+    offsets = collections.deque()
+    rows = _tag_offsets(csv.reader(lines, **progress['dialect']), position,
+                        offsets)
+    resolved = progress['resolved']
+    for (k, v) in (kwargs.pop('resolved', None) or {}).items():
+        resolved.setdefault(k, v)
+    if 'header_present' not in resolved:
+        any_regexes = (hasattr(desired_headers, 'values') and
+                       any(desired_headers.values()))
+        (resolved['header_present'], rows) = _headers_present(
+            kwargs.get('header_present'), rows, any_regexes)
+    rows = _untag_offsets(rows, offsets, progress)
+    for row in reheadered(rows, desired_headers, resolved=resolved, **kwargs):
+        yield row
+        progress['rows_emitted'] += 1
+        if progress['rows_emitted'] % checkpoint_every == 0:
+            _save_checkpoint(checkpoint, progress)
+
+
+def _counted(lines, position):
+    for line in lines:
+        position[0] += len(line)
+        yield line
+
+
+def _tag_offsets(rows, position, offsets):
+    """Note the byte offset just past each row as it is parsed."""
+    for row in rows:
+        offsets.append(position[0])
+        yield row
+
+
+def _untag_offsets(rows, offsets, progress):
+    """Track the offset of each row as it is passed on, after read-ahead."""
+    for row in rows:
+        progress['offset'] = offsets.popleft()
+        yield row
+
+
+def _fmtparams(dialect):
+    return {a: getattr(dialect, a)
+            for a in _DIALECT_ATTRIBUTES if hasattr(dialect, a)}
+
+
+def _checkpoint_source(path, desired_headers, kwargs):
+    """What a checkpoint is valid for, in the form it takes as JSON."""
+    if hasattr(desired_headers, 'items'):
+        template = [[k, getattr(v, 'pattern', v)]
+                    for (k, v) in desired_headers.items()]
+    else:
+        template = [[k, None] for k in desired_headers]
+    return {'path': os.path.abspath(path),
+            'size': os.path.getsize(path),
+            'mtime': os.path.getmtime(path),
+            'headers': sorted(template),
+            'options': {k: kwargs.get(k, default)
+                        for (k, default) in _MAPPING_OPTIONS.items()}}
+
+
+def _load_checkpoint(checkpoint, source):
+    if os.path.exists(checkpoint):
+        with open(checkpoint) as infile:
+            progress = json.load(infile)
+        if progress.get('source') != source:
+            raise ValueError(
+                'Checkpoint {} was written for {}, not {}'.format(
+                    checkpoint, progress.get('source'), source))
+        return progress
+
+
+def _save_checkpoint(checkpoint, progress):
+    temp_path = checkpoint + '.tmp'
+    with open(temp_path, 'w') as outfile:
+        json.dump(progress, outfile)
+    os.replace(temp_path, checkpoint)
+
+
+def detect_encoding(sample):
+    """
+    Guess the codec of a file from a sample of its first bytes.
+
+    >>> detect_encoding(codecs.BOM_UTF8 + b'name,email')
+    'utf-8-sig'
+    >>> detect_encoding(u'nom,ville\\nJos\\xe9,S\\xe8te'.encode('cp1252'))
+    'cp1252'
+    """
+    for (bom, encoding) in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+    for encoding in FALLBACK_ENCODINGS:
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(sample)
+            return encoding
+        except UnicodeDecodeError:
+            pass
+    return 'latin-1'
+
+
+def sniff_dialect(sample, encoding):
+    """Guess the CSV dialect from the complete lines of a byte sample.
+
+    Only the delimiter and quote character are taken from the sample; the
+    rest follows ``csv.excel``, since a sample without doubled quotes or
+    escapes says nothing about how later rows quote.
+    """
+    text = codecs.getincrementaldecoder(encoding)(errors='ignore').decode(
+        sample)
+    if '\n' in text:
+        text = text[:text.rindex('\n') + 1]
+    try:
+        sniffed = csv.Sniffer().sniff(text, DELIMITERS)
+    except csv.Error:
+        return csv.excel
+
+    class dialect(csv.excel):
+        delimiter = sniffed.delimiter
+        quotechar = sniffed.quotechar
+
+    return dialect
+
+
+@contextlib.contextmanager
+def _open(path):
+    """Yield a binary file for ``path``, decompressed if need be."""
+    with open(path, 'rb') as infile:
+        magic = infile.read(_MAGIC_LENGTH)
+        infile.seek(0)
+        for (prefix, decompressor) in _DECOMPRESSORS:
+            if magic.startswith(prefix):
+                with decompressor(infile, 'rb') as decompressed:
+                    yield decompressed
+                return
+        yield infile
+
+
+def _reader(infile, sample, background, queue_size):
+    """Chunks of ``infile``, read in the background if asked."""
+    if background:
+        return _background_chunks(infile, sample, queue_size)
+    return _chunks(infile, sample)
+
+
+def _background_chunks(infile, sample, queue_size):
+    """
+    Like ``_chunks``, but read by a background thread into a bounded queue.
+
+    The thread blocks while the queue is full, so at most ``queue_size``
+    chunks are held in memory.  Closing this generator stops the thread.
+    """
+    chunks = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def read():
+        try:
+            for chunk in _chunks(infile, sample):
+                if not put(chunk):
+                    return
+        except Exception as exc:
+            put(exc)
+            return
+        put(_DONE)
+
+    reader = threading.Thread(target=read)
+    reader.daemon = True
+    reader.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is _DONE:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        stop.set()
+        reader.join()
+
+
+def _chunks(infile, sample):
+    yield sample
+    for chunk in iter(lambda: infile.read(CHUNK_SIZE), b''):
+        yield chunk
+
+
+def _text_lines(chunks, encoding):
+    if _newline_is_byte(encoding):
+        decoder = codecs.getdecoder(encoding)
+        return (decoder(line)[0] for line in _split_lines(chunks, b'\n'))
+    return _split_lines(codecs.iterdecode(chunks, encoding), u'\n')
+
+
+def _newline_is_byte(encoding):
+    """
+    Whether a newline encodes to a lone ``\\n`` byte (after any BOM).
+
+    For such codecs a ``\\n`` byte never occurs inside another character,
+    so raw bytes can be split into lines before decoding.
+
+    >>> _newline_is_byte('utf-8-sig'), _newline_is_byte('utf-16')
+    (True, False)
+    """
+    newline = u'\n'.encode(encoding)
+    return (newline.endswith(b'\n') and
+            u'\n\n'.encode(encoding) == newline + b'\n')
+
+
+def _split_lines(chunks, newline):
+    pending = newline[:0]
+    for chunk in chunks:
+        lines = (pending + chunk).split(newline)
+        pending = lines.pop()
+        for line in lines:
+            yield line + newline
+    if pending:
+        yield pending
@@ -2,8 +2,10 @@
 
 import itertools
 import logging
+import random
 import re
 import string
+from collections.abc import Mapping
 try:
     maketrans = str.maketrans
 except AttributeError:
@@ -31,7 +33,13 @@ def reheadered(data,
                minimum_score=MINIMUM_SCORE,
                optional_prefix=OPTIONAL_PREFIX,
                prefer_fuzzy=False,
-               header_present=None):
+               header_present=None,
+               view=False,
+               converters=None,
+               conversion_errors=None,
+               resolved=None,
+               validation=None,
+               fill_missing=False):
     """Re-emit a data stream with headers altered to `desired_headers`.
 
     Args:
@@ -47,36 +55,466 @@ def reheadered(data,
             desired to data by header similarity.  Default ``False``.
         header_present (*): When ``data`` is a series of lists, whether the
             first data row is headers.
+        view (bool): Yield read-only ``RowView`` mappings that look values up
+            in the source rows instead of building a new dict per row.
+            Default ``False``.
+        converters (dict): {<desired column name>: <callable>} applied to
+            that column's values, in the same pass as the header change.
+            Names that are not desired columns (or, with ``keep_extra``,
+            columns in the data) raise ``ValueError``.
+        conversion_errors (ConversionErrors): When given, values that fail
+            to convert are recorded here and emitted as ``None`` instead of
+            raising.
+        resolved (dict): Filled in with ``header_present``,
+            ``headers_in_data`` (for lists) and ``mapping`` ({<desired
+            column name>: <header in data>}) as they are determined.  Any
+            already present are used as-is instead of being detected again.
+        validation (ValidationReport): When given, a sample of rows is
+            checked against the regexes in ``desired_headers`` and
+            mismatches are tallied in it.
+        fill_missing (bool): Dict rows lacking a mapped key get ``None``
+            for that column instead of raising ``KeyError``.  Default
+            ``False``.
 
     Returns:
-        iterator of dicts with altered keys.
+        iterator of dicts (or ``RowView`` mappings) with altered keys.
     """
 
     expected = _parse_desired_headers(desired_headers, optional_prefix)
+    converters = _parse_converters(converters, optional_prefix)
+    if not keep_extra:
+        _check_converters(converters, expected)
+    regexes = {k: h['regex'] for (k, h) in expected.items() if h['regex']}
     any_regexes = any(h['regex'] for h in expected.values())
+    if resolved is None:
+        resolved = {}
+    records = []
+    if 'mapping' not in resolved:
+        (records, data) = _record_sample(data)
+    if 'header_present' not in resolved:
+        (resolved['header_present'], data) = _headers_present(
+            header_present, data, any_regexes)
+    header_present = resolved['header_present']
+    headers_in_data = resolved.get('headers_in_data')
+    row_function = None
+    validate = None
+    for row in data:
+        if is_empty(row):
+            continue
+        is_list = not hasattr(row, 'keys')
+        if is_list and headers_in_data is None:
+            if header_present:
+                resolved['headers_in_data'] = headers_in_data = row
+                continue
+            else:
+                headers_in_data = ['column_{}'.format(n)
+                                   for n in range(len(row))]
+                resolved['headers_in_data'] = headers_in_data
+        if row_function is None:
+            if 'mapping' not in resolved:
+                resolved['mapping'] = _find_mapping(
+                    row=(_as_dict(row, headers_in_data) if is_list else
+                         _merge_records(records)),
+                    expected=expected,
+                    minimum_score=minimum_score,
+                    prefer_fuzzy=prefer_fuzzy,
+                    keep_extra=keep_extra)
+            else:
+                _check_mapping(resolved['mapping'], expected)
+            if keep_extra:
+                # converters may also name extra columns kept unchanged
+                _check_converters(converters, resolved['mapping'])
+            keys = _source_keys(resolved['mapping'],
+                                headers_in_data if is_list else None)
+            row_function = _row_function(keys, is_list, view, converters,
+                                         conversion_errors,
+                                         fill_missing and not is_list)
+            if validation is not None:
+                validate = validation.validator(keys, regexes)
+        if validate is not None:
+            validate(row)
+        yield row_function(row)
+
+
+class RowView(Mapping):
+    """Read-only mapping of desired header names onto a source row.
+
+    Every view yielded from one stream shares a single ``keys`` table
+    ({<desired column name>: <source key or index>}), so a view costs one
+    small object per row and values are only fetched when looked up.
+    """
+
+    __slots__ = ('_row', '_keys')
+
+    def __init__(self, row, keys):
+        self._row = row
+        self._keys = keys
+
+    def __getitem__(self, key):
+        try:
+            return self._row[self._keys[key]]
+        except IndexError:
+            raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, dict(self))
+
+
+class _FilledRowView(RowView):
+    """``RowView`` giving ``None`` for keys missing from the source row."""
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        return self._row.get(self._keys[key])
+
+
+def _as_dict(row, headers_in_data):
+    return {r[0]: r[1] for r in zip(headers_in_data, row)}
+
+
+class _ColumnTally(object):
+    """Per-column counts, each with up to ``max_examples`` examples."""
+
+    def __init__(self, max_examples=5):
+        self.max_examples = max_examples
+        self.counts = {}
+        self.examples = {}
+
+    def _tally(self, column, example):
+        self.counts[column] = self.counts.get(column, 0) + 1
+        examples = self.examples.setdefault(column, [])
+        if len(examples) < self.max_examples:
+            examples.append(example)
+
+    def __len__(self):
+        return sum(self.counts.values())
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self.counts)
+
+
+class ConversionErrors(_ColumnTally):
+    """Per-column tally of values that a converter failed on.
+
+    Pass an instance as ``conversion_errors`` to ``reheadered`` to have
+    failing cells emitted as ``None`` and recorded here instead of raised.
+    Examples are (value, exception) pairs.
+    """
+
+    def record(self, column, value, exc):
+        self._tally(column, (value, exc))
+
+
+class ValidationError(ValueError):
+    """Raised when a column's sampled mismatch rate exceeds the threshold."""
+
+    def __init__(self, message, report):
+        super(ValidationError, self).__init__(message)
+        self.report = report
+
+
+class ValidationReport(_ColumnTally):
+    """Per-column tally of sampled values not matching their column regex.
+
+    Pass an instance as ``validation`` to ``reheadered``.  Every
+    ``every``-th row, or a random ``fraction`` of rows, has each column
+    that has a regex in ``desired_headers`` checked against it; blank
+    values are not checked.  ``counts`` holds mismatches per column and
+    ``examples`` (row number, value) pairs.
+
+    Args:
+        every (int): Check every Nth row.  Default 100.
+        fraction (float): Instead, check this randomly chosen share of rows.
+        threshold (float): Abort the stream with ``ValidationError`` once a
+            column's mismatch rate among checked rows exceeds this (0-1).
+        minimum_checked (int): Rows to check before applying
+            ``threshold``.  Default 100.
+        max_examples (int): Examples kept per column.  Default 5.
+        seed: Seed for choosing the ``fraction`` of rows.
+    """
+
+    def __init__(self,
+                 every=100,
+                 fraction=None,
+                 threshold=None,
+                 minimum_checked=100,
+                 max_examples=5,
+                 seed=None):
+        if fraction is None:
+            if not isinstance(every, int) or every < 1:
+                raise ValueError(
+                    'every must be a positive integer, not {!r}'.format(
+                        every))
+        elif not 0 < fraction <= 1:
+            raise ValueError(
+                'fraction must be in (0, 1], not {!r}'.format(fraction))
+        if threshold is not None and not 0 <= threshold <= 1:
+            raise ValueError(
+                'threshold must be in [0, 1], not {!r}'.format(threshold))
+        if minimum_checked < 0 or max_examples < 0:
+            raise ValueError('minimum_checked and max_examples must not be '
+                             'negative')
+        super(ValidationReport, self).__init__(max_examples)
+        self.every = every
+        self.fraction = fraction
+        self.threshold = threshold
+        self.minimum_checked = minimum_checked
+        self.rows_seen = 0
+        self.rows_checked = 0
+        self._random = random.Random(seed)
+
+    def mismatch_rate(self, column):
+        if not self.rows_checked:
+            return 0.0
+        return self.counts.get(column, 0) / float(self.rows_checked)
+
+    def validator(self, keys, regexes):
+        """
+        Function checking sampled source rows, for ``reheadered``.
+
+        ``keys`` is {<desired column name>: <source key or index>}.
+        """
+        checks = [(k, keys[k], regexes[k]) for k in keys if k in regexes]
+
+        def validate(row):
+            self.rows_seen += 1
+            if self.fraction is None:
+                if self.rows_seen % self.every:
+                    return
+            elif self._random.random() >= self.fraction:
+                return
+            self.rows_checked += 1
+            for (column, key, regex) in checks:
+                try:
+                    value = row[key]
+                except (IndexError, KeyError):
+                    continue
+                if value is None:
+                    continue
+                text = value if hasattr(value, 'strip') else str(value)
+                if text.strip() and not regex.search(text):
+                    self._tally(column, (self.rows_seen, value))
+            if (self.threshold is not None and
+                    self.rows_checked >= self.minimum_checked):
+                self._check_threshold()
+
+        return validate
+
+    def _check_threshold(self):
+        for column in self.counts:
+            if self.mismatch_rate(column) > self.threshold:
+                raise ValidationError(
+                    '{} mismatched in {} of {} sampled rows'.format(
+                        column, self.counts[column], self.rows_checked), self)
+
+
+class Preflight(object):
+    """What ``reheadered`` would decide about a source, from its first rows.
+
+    Attributes:
+        header_present (bool): Whether the first row is taken as headers.
+        headers_in_data (list): Headers of list rows, if any.
+        mapping (dict): {<desired column name>: <header in data>}.
+        scores (dict): {<desired column name>: 0-100 similarity of its
+            name to the header it was matched to}.
+        methods (dict): {<desired column name>: 'regex', 'fuzzy' or
+            'unchanged'}, how each column was matched.
+        unmet (list): Required columns that were not found.
+        error (Exception): Set instead if the source could not be read.
+    """
+
+    def __init__(self,
+                 header_present=None,
+                 headers_in_data=None,
+                 mapping=None,
+                 scores=None,
+                 methods=None,
+                 unmet=None,
+                 error=None):
+        self.header_present = header_present
+        self.headers_in_data = headers_in_data
+        self.mapping = mapping or {}
+        self.scores = scores or {}
+        self.methods = methods or {}
+        self.unmet = unmet or []
+        self.error = error
+
+    @property
+    def ok(self):
+        """Whether ``reheadered`` would start without error."""
+        return self.error is None and not self.unmet
+
+    @property
+    def resolved(self):
+        """Decisions to pass as ``resolved`` when reading from the start.
+
+        Raises the read error, or ``KeyError`` if required columns are
+        unmet, rather than let ``reheadered`` go on without them.
+        """
+        if self.error is not None:
+            raise self.error
+        if self.unmet:
+            raise KeyError('{} not found in {}'.format(self.unmet,
+                                                       self.mapping))
+        return {'header_present': self.header_present,
+                'mapping': dict(self.mapping)}
+
+    def __repr__(self):
+        if self.error is not None:
+            return '{}(error={!r})'.format(type(self).__name__, self.error)
+        return '{}(mapping={!r}, unmet={!r})'.format(
+            type(self).__name__, self.mapping, self.unmet)
+
+
+def _preflight_rows(data,
+                    desired_headers,
+                    keep_extra=False,
+                    minimum_score=MINIMUM_SCORE,
+                    optional_prefix=OPTIONAL_PREFIX,
+                    prefer_fuzzy=False,
+                    header_present=None):
+    """``Preflight`` of a finite series of dicts or lists."""
+    expected = _parse_desired_headers(desired_headers, optional_prefix)
+    any_regexes = any(h['regex'] for h in expected.values())
+    (records, data) = _record_sample(data)
     (header_present, data) = _headers_present(header_present, data,
                                               any_regexes)
-    headers_in_data = None
-    mapping = {}
+    result = Preflight(header_present=header_present)
     for row in data:
         if is_empty(row):
             continue
-        if not hasattr(row, 'keys'):
-            if headers_in_data is None:
+        if records:
+            row = _merge_records(records)
+        else:
+            if result.headers_in_data is None:
                 if header_present:
-                    headers_in_data = row
+                    result.headers_in_data = row
                     continue
-                else:
-                    headers_in_data = ['column_{}'.format(n)
-                                       for n in range(len(row))]
-            row = {r[0]: r[1] for r in zip(headers_in_data, row)}
-        if not mapping:
-            mapping = _find_mapping(row=row,
-                                    expected=expected,
-                                    minimum_score=minimum_score,
-                                    prefer_fuzzy=prefer_fuzzy,
-                                    keep_extra=keep_extra)
-        yield {k: row[mapping[k]] for k in mapping}
+                result.headers_in_data = ['column_{}'.format(n)
+                                          for n in range(len(row))]
+            row = _as_dict(row, result.headers_in_data)
+        (result.mapping, result.methods, result.unmet) = _match_columns(
+            row, expected, minimum_score, prefer_fuzzy, keep_extra)
+        result.scores = {k: _similarity(k, result.mapping[k])
+                         for k in result.mapping}
+        return result
+    result.unmet = [h for h in expected if expected[h]['required']]
+    return result
+
+
+def _column_name(header, optional_prefix):
+    """
+    The output column name for a desired header.
+
+    >>> _column_name(' ?:zip  code', '?:')
+    'zip code'
+    """
+    header = header.strip()
+    if header.startswith(optional_prefix):
+        header = header[len(optional_prefix):]
+    return _normalize_whitespace(header)
+
+
+def _parse_converters(converters, optional_prefix):
+    return {_column_name(k, optional_prefix): converter
+            for (k, converter) in (converters or {}).items()}
+
+
+def _source_keys(mapping, headers_in_data):
+    """
+    {<desired column name>: <key or index in source rows>}
+
+    ``mapping`` is {<desired column name>: <header in data>}; when
+    ``headers_in_data`` is given, source rows are lists in that order.
+    """
+    if headers_in_data is None:
+        return dict(mapping)
+    positions = {h: n for (n, h) in enumerate(headers_in_data)}
+    return {k: positions[mapping[k]] for k in mapping}
+
+
+def _check_converters(converters, columns):
+    unknown = sorted(k for k in converters if k not in columns)
+    if unknown:
+        raise ValueError('converters given for {}, not in {}'.format(
+            unknown, sorted(columns)))
+
+
+def _row_function(keys,
+                  is_list,
+                  view,
+                  converters=None,
+                  conversion_errors=None,
+                  fill_missing=False):
+    """
+    Build the function turning one source row into one output row.
+    """
+    if view:
+        if converters:
+            raise ValueError('converters cannot be applied to a view')
+        if fill_missing:
+            return lambda row: _FilledRowView(row, keys)
+        return lambda row: RowView(row, keys)
+    return _compile_row_function(keys, converters or {}, conversion_errors,
+                                 is_list, fill_missing)
+
+
+def _compile_row_function(keys,
+                          converters,
+                          conversion_errors,
+                          is_list,
+                          fill_missing=False):
+    """
+    Generate one function building an output row as a single dict display.
+
+    Cells that fail to convert, and list rows too short for the mapping,
+    are handed to a slower cell-by-cell fallback that records conversion
+    errors and reports missing cells as ``KeyError``.  With ``fill_missing``,
+    keys missing from dict rows are looked up with ``get``.
+    """
+
+    def slow(row):
+        result = {}
+        for (k, key) in keys.items():
+            try:
+                value = row.get(key) if fill_missing else row[key]
+            except IndexError:
+                raise KeyError(k)
+            if k in converters:
+                try:
+                    value = converters[k](value)
+                except Exception as exc:
+                    if conversion_errors is None:
+                        raise
+                    conversion_errors.record(k, value, exc)
+                    value = None
+            result[k] = value
+        return result
+
+    namespace = {'slow': slow}
+    cells = []
+    for (n, k) in enumerate(keys):
+        namespace['k{}'.format(n)] = k
+        namespace['a{}'.format(n)] = keys[k]
+        cell = ('row.get(a{})' if fill_missing else 'row[a{}]').format(n)
+        if k in converters:
+            namespace['c{}'.format(n)] = converters[k]
+            cell = 'c{}({})'.format(n, cell)
+        cells.append('k{}: {}'.format(n, cell))
+    body = 'return {{{}}}'.format(', '.join(cells))
+    if is_list or (converters and conversion_errors is not None):
+        body = 'try:\n        {}\n    except Exception:\n' \
+               '        return slow(row)'.format(body)
+    source = 'def row_function(row):\n    {}\n'.format(body)
+    exec(source, namespace)
+    return namespace['row_function']
 
 
 def _normalize_whitespace(s):
@@ -143,6 +581,9 @@ def _map_by_fuzzy_header_name(actual, val, expected, minimum_score):
 
 
 def _map_by_regex(actual, val, expected, minimum_score):
+    if not hasattr(val, 'strip'):
+        # e.g. numbers parsed from JSON
+        val = '' if val is None else str(val)
     for col in expected:
         if expected[col]['regex'] and expected[col]['regex'].search(val):
             logging.debug('Successful regex match to {}'.format(val))
@@ -153,27 +594,56 @@ def _map_unchanged(actual, val, expected, minimum_score):
     return actual
 
 
+def _check_mapping(mapping, expected):
+    """Raise ``KeyError`` if a given ``mapping`` lacks required columns."""
+    unmet = [h for h in expected
+             if expected[h]['required'] and h not in mapping]
+    if unmet:
+        raise KeyError('{} not found in {}'.format(unmet, mapping))
+
+
 def _find_mapping(row, expected, minimum_score, prefer_fuzzy, keep_extra):
     """
     Determine dict relating header_in_data:user_expected_header
     """
+    (mapping, methods, unmet) = _match_columns(row, expected, minimum_score,
+                                               prefer_fuzzy, keep_extra)
+    if unmet:
+        err_msg = '{} not found in {}'.format(unmet, row)
+        raise KeyError(err_msg)
+    return mapping
+
+
+_METHODS = {_map_by_regex: 'regex',
+            _map_by_fuzzy_header_name: 'fuzzy',
+            _map_unchanged: 'unchanged'}
+
+
+def _match_columns(row, expected, minimum_score, prefer_fuzzy, keep_extra):
+    """
+    Match the headers of ``row`` to the ``expected`` columns.
+
+    Matched columns are removed from ``expected``.  Returns the mapping
+    {<desired column name>: <header in data>}, {<desired column name>:
+    'regex', 'fuzzy' or 'unchanged'} telling how each was matched, and
+    the list of required columns left unmatched.
+    """
     mappers = [_map_by_regex, _map_by_fuzzy_header_name]
     if prefer_fuzzy:
         mappers.reverse()
     if keep_extra:
         mappers.append(_map_unchanged)
     mapping = {}
+    methods = {}
     for mapper in mappers:
         for col in row:
             if not mapping.get(col):
                 mapping[col] = mapper(col, row[col], expected, minimum_score)
                 if mapping[col]:
                     expected.pop(mapping[col], None)
+                    methods[mapping[col]] = _METHODS[mapper]
     unmet = [h for h in expected if expected[h]['required']]
-    if unmet:
-        err_msg = '{} not found in {}'.format(unmet, row)
-        raise KeyError(err_msg)
-    return {mapping[k]: k for k in mapping if mapping[k]}
+    return ({mapping[k]: k for k in mapping if mapping[k]}, methods, unmet)
 
 
 _roughen_in = ascii_lowercase + ascii_uppercase + digits
@@ -230,6 +700,42 @@ def _big_difference_first_to_second_row(rows):
     return header_similarity < average_similarity - 10
 
 
+def _record_sample(data):
+    """
+    The first non-empty rows of ``data`` if they are dicts, and ``data``.
+
+    Records may each lack some keys (JSON exports often drop null values),
+    so columns are matched against all the keys in this sample.  Nothing
+    beyond the first non-empty row is read ahead if ``data`` holds lists.
+    """
+    data = iter(data)
+    seen = []
+    for row in data:
+        seen.append(row)
+        if not is_empty(row):
+            break
+    data = itertools.chain(seen, data)
+    if not seen or not hasattr(seen[-1], 'keys'):
+        return ([], data)
+    return _nonempty_row_slice(data)
+
+
+def _merge_records(records):
+    """
+    One dict with every key in ``records``, each with its first value
+    that is not blank.
+
+    >>> sorted(_merge_records([{'a': None}, {'a': 1, 'b': 2}]).items())
+    [('a', 1), ('b', 2)]
+    """
+    merged = {}
+    for record in records:
+        for (key, value) in record.items():
+            if merged.get(key) in (None, ''):
+                merged[key] = value
+    return merged
+
+
 def _headers_present(header_present, data, any_regexes):
     if header_present in (True, False):
         return (header_present, data)
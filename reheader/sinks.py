@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Load reheadered rows into databases.
+"""
+
+import itertools
+import sqlite3
+
+from .reheader import OPTIONAL_PREFIX, _column_name
+
+BATCH_SIZE = 10000
+
+
+def load_sqlite(rows,
+                database,
+                table,
+                desired_headers,
+                batch_size=BATCH_SIZE,
+                optional_prefix=OPTIONAL_PREFIX):
+    """Insert rows into a SQLite table laid out by ``desired_headers``.
+
+    The table gets one column per desired header, in template order.  It
+    is created if missing; if it exists it must have all those columns.
+    Rows are inserted as positional tuples with ``executemany``, one
+    transaction per ``batch_size`` rows, each committed as it completes.
+
+    Args:
+        rows (iterator): Dicts (e.g. from ``reheadered``) or tuples already
+            in template order.  Optional columns missing from a dict are
+            inserted as NULL, required ones raise ``KeyError``; columns not
+            in the template are ignored.
+        database (str or sqlite3.Connection): Database path or connection.
+            A connection with a transaction already open raises
+            ``ValueError``, since committing the batches would commit it.
+        table (str): Name of the target table.
+        desired_headers (dict or list): The template given to
+            ``reheadered``.
+        batch_size (int): Rows per ``executemany`` call and transaction.
+            Default 10000.
+        optional_prefix (str): As for ``reheadered``.
+
+    Returns:
+        int: number of rows inserted.
+    """
+    columns = [_column_name(h, optional_prefix) for h in desired_headers]
+    required = [_column_name(h, optional_prefix) for h in desired_headers
+                if not h.strip().startswith(optional_prefix)]
+    if isinstance(database, sqlite3.Connection):
+        if database.in_transaction:
+            raise ValueError('Connection has a transaction open; commit or '
+                             'roll it back before loading')
+        return _load(rows, database, table, columns, required, batch_size)
+    connection = sqlite3.connect(database)
+    try:
+        return _load(rows, connection, table, columns, required, batch_size)
+    finally:
+        connection.close()
+
+
+def _load(rows, connection, table, columns, required, batch_size):
+    _prepare_table(connection, table, columns)
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        _quote(table), ', '.join(_quote(c) for c in columns),
+        ', '.join('?' for c in columns))
+    values = (_positional(row, columns, required) for row in rows)
+    inserted = 0
+    while True:
+        batch = list(itertools.islice(values, batch_size))
+        if not batch:
+            return inserted
+        with connection:
+            connection.executemany(sql, batch)
+        inserted += len(batch)
+
+
+def _prepare_table(connection, table, columns):
+    existing = [r[1] for r in connection.execute('PRAGMA table_info({})'
+                                                 .format(_quote(table)))]
+    if not existing:
+        with connection:
+            connection.execute('CREATE TABLE {} ({})'.format(
+                _quote(table), ', '.join(_quote(c) for c in columns)))
+        return
+    missing = [c for c in columns if c not in existing]
+    if missing:
+        raise ValueError('{} not found in table {} ({})'.format(
+            missing, table, existing))
+
+
+def _positional(row, columns, required):
+    if hasattr(row, 'keys'):
+        missing = [c for c in required if c not in row]
+        if missing:
+            raise KeyError('{} not found in {}'.format(missing, dict(row)))
+        return tuple(row.get(c) for c in columns)
+    return row
+
+
+def _quote(identifier):
+    return '"{}"'.format(identifier.replace('"', '""'))
@@ -0,0 +1,445 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test_files
+----------------------------------
+
+Tests for `reheader.files` module.
+"""
+
+import bz2
+import codecs
+import gzip
+import json
+import lzma
+import threading
+from io import StringIO
+
+import pytest
+import reheader.files
+from reheader import (preflight, preflight_many, reheader_file, reheader_jsonl,
+                      write_jsonl)
+from reheader.files import detect_encoding
+
+_raw_txt = u"""name,email,zip
+Nellie Newsock,nellie@sox.com,45309
+José Martí,jose@habana.cu,10001
+Grace Hopper,grace@navy.mil,21401
+"""
+
+
+def _write(tmpdir, content, name='data.csv'):
+    path = tmpdir.join(name)
+    path.write_binary(content)
+    return str(path)
+
+
+class TestReheaderFile(object):
+    def test_plain_file(self, tmpdir):
+        path = _write(tmpdir, _raw_txt.encode('utf-8'))
+        rows = list(reheader_file(path, ['name', 'mail', 'zipcode']))
+        assert len(rows) == 3
+        assert rows[1] == {'name': u'José Martí',
+                           'mail': 'jose@habana.cu',
+                           'zipcode': '10001'}
+
+    def test_small_sample_reads_whole_file(self, tmpdir):
+        path = _write(tmpdir, _raw_txt.encode('utf-8'))
+        rows = list(reheader_file(path, ['name', 'email'], sample_size=20))
+        assert [r['name'] for r in rows][-1] == 'Grace Hopper'
+        assert rows[1]['name'] == u'José Martí'
+
+    def test_sniffed_dialect(self, tmpdir):
+        content = _raw_txt.replace(',', ';').replace('\n', '\r\n')
+        path = _write(tmpdir, content.encode('utf-8'))
+        rows = list(reheader_file(path, ['name', 'email']))
+        assert rows[0] == {'name': 'Nellie Newsock',
+                           'email': 'nellie@sox.com'}
+
+    @pytest.mark.parametrize('encoding', ['utf-8-sig', 'utf-16', 'cp1252'])
+    def test_detected_encoding(self, tmpdir, encoding):
+        path = _write(tmpdir, _raw_txt.encode(encoding))
+        rows = list(reheader_file(path, ['name', 'email']))
+        assert rows[0]['name'] == 'Nellie Newsock'
+        assert rows[1]['name'] == u'José Martí'
+
+    def test_doubled_quotes_after_sample(self, tmpdir):
+        content = _raw_txt + u'Ann,"She said ""hi"", then left",99999\n'
+        path = _write(tmpdir, content.encode('utf-8'))
+        rows = list(reheader_file(path, ['name', 'email'], sample_size=60))
+        assert rows[-1] == {'name': 'Ann',
+                            'email': 'She said "hi", then left'}
+
+    def test_explicit_encoding(self, tmpdir):
+        path = _write(tmpdir, _raw_txt.encode('utf-8'))
+        rows = list(reheader_file(path, ['name'], encoding='latin-1'))
+        assert rows[1]['name'] == u'José Martí'.encode('utf-8').decode(
+            'latin-1')
+
+    def test_header_absent(self, tmpdir):
+        content = u''.join(_raw_txt.splitlines(True)[1:])
+        path = _write(tmpdir, content.encode('utf-8'))
+        headers = {'name': r'\w+\s+\w+', 'email': r'\w+@\w+\.\w+'}
+        rows = list(reheader_file(path, headers, header_present=False))
+        assert len(rows) == 3
+        assert rows[0]['email'] == 'nellie@sox.com'
+
+    def test_keyword_arguments_passed_on(self, tmpdir):
+        path = _write(tmpdir, _raw_txt.encode('utf-8'))
+        rows = list(reheader_file(path, ['name'], keep_extra=True))
+        assert rows[0]['zip'] == '45309'
+
+
+def _numbered_file(tmpdir, rows=55):
+    content = u'name,number\n' + u''.join(
+        u'Pers\xf3n {0},{0}\n'.format(n) for n in range(rows))
+    return _write(tmpdir, content.encode('utf-8'))
+
+
+def _consume(rows, count):
+    result = [r for (_, r) in zip(range(count), rows)]
+    rows.close()
+    return result
+
+
+class TestCheckpoint(object):
+    def test_checkpoint_written(self, tmpdir):
+        path = _numbered_file(tmpdir)
+        checkpoint = str(tmpdir.join('progress.json'))
+        rows = reheader_file(path, ['name', 'number'], checkpoint=checkpoint,
+                             checkpoint_every=10)
+        _consume(rows, 25)
+        with open(checkpoint) as infile:
+            progress = json.load(infile)
+        assert progress['rows_emitted'] == 20
+        assert progress['resolved']['header_present'] is True
+        assert progress['resolved']['mapping'] == {'name': 'name',
+                                                   'number': 'number'}
+        with open(path, 'rb') as infile:
+            infile.seek(progress['offset'])
+            assert infile.readline().startswith(u'Pers\xf3n 20,'.encode(
+                'utf-8'))
+
+    def test_resume(self, tmpdir, monkeypatch):
+        path = _numbered_file(tmpdir)
+        checkpoint = str(tmpdir.join('progress.json'))
+        headers = ['name', 'number']
+        rows = reheader_file(path, headers, checkpoint=checkpoint,
+                             checkpoint_every=10)
+        first = _consume(rows, 33)
+
+        def fail(*args, **kwargs):
+            raise AssertionError('detection repeated')
+
+        monkeypatch.setattr(reheader.files, '_headers_present', fail)
+        monkeypatch.setattr(reheader.reheader, '_find_mapping', fail)
+        rest = list(reheader_file(path, headers, checkpoint=checkpoint,
+                                  checkpoint_every=10))
+        assert [r['number'] for r in first[:30] + rest] == \
+            [str(n) for n in range(55)]
+        assert not tmpdir.join('progress.json').exists()
+
+    @pytest.mark.parametrize('change', ['headers', 'options', 'file'])
+    def test_mismatched_checkpoint(self, tmpdir, change):
+        path = _numbered_file(tmpdir)
+        checkpoint = str(tmpdir.join('progress.json'))
+        headers = ['name', 'number']
+        _consume(reheader_file(path, headers, checkpoint=checkpoint,
+                               checkpoint_every=10), 15)
+        kwargs = {}
+        if change == 'headers':
+            headers = ['number']
+        elif change == 'options':
+            kwargs['keep_extra'] = True
+        else:
+            path = _numbered_file(tmpdir.mkdir('other'), rows=3)
+        with pytest.raises(ValueError):
+            list(reheader_file(path, headers, checkpoint=checkpoint,
+                               **kwargs))
+        assert tmpdir.join('progress.json').exists()
+
+    def test_checkpoint_removed_when_done(self, tmpdir):
+        path = _numbered_file(tmpdir, rows=5)
+        checkpoint = str(tmpdir.join('progress.json'))
+        rows = list(reheader_file(path, ['name'], checkpoint=checkpoint,
+                                  checkpoint_every=2))
+        assert len(rows) == 5
+        assert not tmpdir.join('progress.json').exists()
+
+    def test_checkpoint_needs_byte_lines(self, tmpdir):
+        path = _write(tmpdir, _raw_txt.encode('utf-16'))
+        checkpoint = str(tmpdir.join('progress.json'))
+        with pytest.raises(ValueError):
+            list(reheader_file(path, ['name'], checkpoint=checkpoint))
+
+
+_COMPRESSORS = {'gz': gzip.compress, 'bz2': bz2.compress,
+                'xz': lzma.compress}
+
+
+class TestCompressedInput(object):
+    @pytest.mark.parametrize('suffix', sorted(_COMPRESSORS))
+    def test_decompressed(self, tmpdir, suffix):
+        content = _COMPRESSORS[suffix](_raw_txt.encode('cp1252'))
+        path = _write(tmpdir, content, name='data.' + suffix)
+        rows = list(reheader_file(path, ['name', 'email']))
+        assert len(rows) == 3
+        assert rows[1]['name'] == u'José Martí'
+
+    @pytest.mark.parametrize('background', [True, False])
+    def test_background_optional(self, tmpdir, monkeypatch, background):
+        monkeypatch.setattr(reheader.files, 'CHUNK_SIZE', 7)
+        content = gzip.compress(_raw_txt.encode('utf-8'))
+        path = _write(tmpdir, content, name='data.gz')
+        rows = reheader_file(path, ['name', 'email'], sample_size=10,
+                             background=background, queue_size=1)
+        assert [r['email'] for r in rows] == ['nellie@sox.com',
+                                              'jose@habana.cu',
+                                              'grace@navy.mil']
+
+    def test_background_thread_stopped(self, tmpdir, monkeypatch):
+        monkeypatch.setattr(reheader.files, 'CHUNK_SIZE', 16)
+        path = _numbered_file(tmpdir, rows=500)
+        threads = threading.active_count()
+        rows = reheader_file(path, ['name'], background=True, queue_size=2)
+        _consume(rows, 3)
+        assert threading.active_count() == threads
+
+    def test_corrupt_input_raises(self, tmpdir):
+        content = gzip.compress(_raw_txt.encode('utf-8'))[:-12]
+        path = _write(tmpdir, content, name='data.gz')
+        with pytest.raises(EOFError):
+            list(reheader_file(path, ['name']))
+
+    def test_resume_compressed(self, tmpdir):
+        path = _numbered_file(tmpdir)
+        with open(path, 'rb') as infile:
+            content = gzip.compress(infile.read())
+        path = _write(tmpdir, content, name='numbered.csv.gz')
+        checkpoint = str(tmpdir.join('progress.json'))
+        headers = ['name', 'number']
+        rows = reheader_file(path, headers, checkpoint=checkpoint,
+                             checkpoint_every=10)
+        first = _consume(rows, 12)
+        rest = list(reheader_file(path, headers, checkpoint=checkpoint))
+        assert [r['number'] for r in first[:10] + rest] == \
+            [str(n) for n in range(55)]
+
+
+_raw_jsonl = u"""\
+{"Name": "Nellie Newsock", "e-mail": "nellie@sox.com", "zip": 45309}
+
+{"Name": "José Martí", "e-mail": "jose@habana.cu", "zip": 10001}
+{"Name": "Grace Hopper", "e-mail": "grace@navy.mil", "zip": null}
+"""
+
+
+class TestReheaderJsonl(object):
+    def test_stream(self):
+        rows = list(reheader_jsonl(StringIO(_raw_jsonl), ['name', 'email']))
+        assert rows == [{'name': 'Nellie Newsock', 'email': 'nellie@sox.com'},
+                        {'name': u'José Martí', 'email': 'jose@habana.cu'},
+                        {'name': 'Grace Hopper', 'email': 'grace@navy.mil'}]
+
+    @pytest.mark.parametrize('suffix', ['jsonl', 'jsonl.gz'])
+    def test_path(self, tmpdir, suffix):
+        content = _raw_jsonl.encode('utf-8')
+        if suffix.endswith('gz'):
+            content = gzip.compress(content)
+        path = _write(tmpdir, content, name='data.' + suffix)
+        rows = list(reheader_jsonl(path, ['name', 'email']))
+        assert [r['name'] for r in rows][1] == u'José Martí'
+
+    def test_regex_on_numbers(self):
+        headers = {'name': None, 'postal': r'^\d{5}$'}
+        rows = list(reheader_jsonl(StringIO(_raw_jsonl), headers))
+        assert [r['postal'] for r in rows] == [45309, 10001, None]
+
+    def test_output(self, tmpdir):
+        output = str(tmpdir.join('out.jsonl'))
+        written = reheader_jsonl(StringIO(_raw_jsonl), ['name', 'zip'],
+                                 output=output)
+        assert written == 3
+        with open(output, encoding='utf-8') as infile:
+            lines = infile.read().splitlines()
+        assert [json.loads(line) for line in lines][1] == {
+            'name': u'José Martí', 'zip': 10001}
+        assert u'José' in lines[1]
+
+    def test_missing_keys(self):
+        source = StringIO(_raw_jsonl + u'{"Name": "Ada Lovelace"}\n')
+        rows = list(reheader_jsonl(source, ['name', 'email']))
+        assert rows[-1] == {'name': 'Ada Lovelace', 'email': None}
+
+    def test_first_record_missing_key(self):
+        source = u'{"Name": "Ada Lovelace"}\n' + _raw_jsonl
+        rows = list(reheader_jsonl(StringIO(source), ['name', 'email']))
+        assert rows[0] == {'name': 'Ada Lovelace', 'email': None}
+        assert rows[1]['email'] == 'nellie@sox.com'
+
+    def test_missing_keys_view(self):
+        source = StringIO(_raw_jsonl + u'{"Name": "Ada Lovelace"}\n')
+        rows = list(reheader_jsonl(source, ['name', 'email'], view=True))
+        assert dict(rows[-1]) == {'name': 'Ada Lovelace', 'email': None}
+
+    def test_missing_keys_strict(self):
+        source = StringIO(_raw_jsonl + u'{"Name": "Ada Lovelace"}\n')
+        with pytest.raises(KeyError):
+            list(reheader_jsonl(source, ['name', 'email'],
+                                fill_missing=False))
+
+    def test_output_view(self):
+        output = StringIO()
+        written = reheader_jsonl(StringIO(_raw_jsonl), ['name', 'email'],
+                                 output=output, view=True)
+        assert written == 3
+        lines = output.getvalue().splitlines()
+        assert json.loads(lines[0]) == {'name': 'Nellie Newsock',
+                                        'email': 'nellie@sox.com'}
+
+    def test_write_unserializable(self):
+        with pytest.raises(TypeError):
+            write_jsonl([{'when': object()}], StringIO())
+
+    def test_write_batches(self):
+        output = StringIO()
+        rows = ({'n': n} for n in range(25))
+        assert write_jsonl(rows, output, batch_size=10) == 25
+        lines = output.getvalue().splitlines()
+        assert [json.loads(line)['n'] for line in lines] == list(range(25))
+
+
+class TestPreflight(object):
+    def test_file(self, tmpdir):
+        path = _write(tmpdir, _raw_txt.encode('utf-8'))
+        result = preflight(path, ['name', 'mail', 'zipcode'])
+        assert result.ok
+        assert result.header_present is True
+        assert result.headers_in_data == ['name', 'email', 'zip']
+        assert result.mapping == {'name': 'name', 'mail': 'email',
+                                  'zipcode': 'zip'}
+        assert result.methods == {'name': 'fuzzy', 'mail': 'fuzzy',
+                                  'zipcode': 'fuzzy'}
+        assert result.scores['name'] == 100
+        assert 60 <= result.scores['zipcode'] < 100
+
+    def test_unmet_reported(self, tmpdir):
+        path = _write(tmpdir, _raw_txt.encode('utf-8'))
+        result = preflight(path, ['name', 'thy one true zip code'])
+        assert not result.ok
+        assert result.unmet == ['thy one true zip code']
+        assert result.mapping == {'name': 'name'}
+
+    def test_regexes_without_header(self, tmpdir):
+        content = u''.join(_raw_txt.splitlines(True)[1:])
+        path = _write(tmpdir, content.encode('utf-8'))
+        headers = {'name': r'\w+\s+\w+', 'email': r'\w+@\w+\.\w+'}
+        result = preflight(path, headers, header_present=False)
+        assert result.ok
+        assert result.mapping == {'name': 'column_0', 'email': 'column_1'}
+        assert result.methods == {'name': 'regex', 'email': 'regex'}
+
+    def test_bounded_sample(self, tmpdir):
+        content = _raw_txt + u'\xff\xfe garbage\n' * 10000
+        path = _write(tmpdir, content.encode('utf-8') + b'\xff' * 1000)
+        result = preflight(path, ['name', 'email'], sample_size=100,
+                           header_present=True)
+        assert result.ok
+
+    def test_bounded_rows(self):
+        def rows():
+            yield ['name', 'email']
+            yield ['Grace Hopper', 'grace@navy.mil']
+            yield ['Ada Lovelace', 'ada@maths.uk']
+            raise AssertionError('read too far')
+
+        result = preflight(rows(), ['name', 'email'], sample_rows=3,
+                           header_present=True)
+        assert result.mapping == {'name': 'name', 'email': 'email'}
+
+    def test_empty_source(self):
+        result = preflight([], ['name', 'email'])
+        assert result.unmet == ['name', 'email']
+
+    def test_jsonl_file(self, tmpdir):
+        content = gzip.compress(_raw_jsonl.encode('utf-8'))
+        path = _write(tmpdir, content, name='data.jsonl.gz')
+        result = preflight(path, ['name', 'email'])
+        assert result.mapping == {'name': 'Name', 'email': 'e-mail'}
+
+    def test_first_record_missing_key(self, tmpdir):
+        content = u'{"Name": "Ada Lovelace"}\n' + _raw_jsonl
+        path = _write(tmpdir, content.encode('utf-8'), name='data.jsonl')
+        result = preflight(path, ['name', 'email'])
+        assert result.ok
+        assert result.mapping == {'name': 'Name', 'email': 'e-mail'}
+
+    def test_resolved_reused(self, tmpdir, monkeypatch):
+        path = _write(tmpdir, _raw_txt.encode('utf-8'))
+        headers = ['name', 'mail']
+        expected = list(reheader_file(path, headers))
+        result = preflight(path, headers)
+        monkeypatch.setattr(reheader.reheader, '_find_mapping', None)
+        assert list(reheader_file(path, headers,
+                                  resolved=result.resolved)) == expected
+
+    def test_unmet_not_resolved(self, tmpdir):
+        path = _write(tmpdir, _raw_txt.encode('utf-8'))
+        result = preflight(path, ['name', 'zzzzzzzzzz'])
+        with pytest.raises(KeyError):
+            result.resolved
+
+    def test_resolved_reused_with_checkpoint(self, tmpdir, monkeypatch):
+        path = _numbered_file(tmpdir)
+        headers = ['name', 'number']
+        result = preflight(path, headers)
+        checkpoint = str(tmpdir.join('progress.json'))
+
+        def fail(*args, **kwargs):
+            raise AssertionError('detection repeated')
+
+        monkeypatch.setattr(reheader.files, '_headers_present', fail)
+        monkeypatch.setattr(reheader.reheader, '_find_mapping', fail)
+        rows = reheader_file(path, headers, checkpoint=checkpoint,
+                             checkpoint_every=10, resolved=result.resolved)
+        first = _consume(rows, 15)
+        rest = list(reheader_file(path, headers, checkpoint=checkpoint,
+                                  resolved=result.resolved))
+        assert [r['number'] for r in first[:10] + rest] == \
+            [str(n) for n in range(55)]
+
+    def test_many(self, tmpdir):
+        good = _write(tmpdir, _raw_txt.encode('utf-8'), name='good.csv')
+        bad = _write(tmpdir, b'title,year\nDune,1965\n', name='bad.csv')
+        missing = str(tmpdir.join('missing.csv'))
+        results = preflight_many([good, bad, missing], ['name', 'email'],
+                                 workers=3)
+        assert results[good].ok
+        assert results[bad].unmet == ['name', 'email']
+        assert isinstance(results[missing].error, IOError)
+        assert not results[missing].ok
+
+    def test_many_rejects_other_options(self, tmpdir):
+        path = _write(tmpdir, _raw_txt.encode('utf-8'))
+        with pytest.raises(TypeError):
+            preflight_many([path], ['name'], view=True)
+
+    def test_many_raises_bugs(self, tmpdir, monkeypatch):
+        path = _write(tmpdir, _raw_txt.encode('utf-8'))
+
+        def fail(*args, **kwargs):
+            raise AttributeError('bug')
+
+        monkeypatch.setattr(reheader.files, '_preflight_rows', fail)
+        with pytest.raises(AttributeError):
+            preflight_many([path], ['name'], workers=1)
+
+
+class TestDetectEncoding(object):
+    def test_bom(self):
+        assert detect_encoding(codecs.BOM_UTF16_LE + b'n\x00') == 'utf-16'
+        assert detect_encoding(codecs.BOM_UTF32_LE + b'n\x00\x00\x00') == \
+            'utf-32'
+
+    def test_truncated_multibyte_character(self):
+        assert detect_encoding(u'Jos\xe9'.encode('utf-8')[:-1]) == 'utf-8'
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test_memory
+----------------------------------
+
+Memory regression tests: every public entry point must stream, so peak
+memory may not grow with the number of rows.
+
+Each case is run over ``REHEADER_MEMORY_ROWS`` rows (default 50000; set it
+in the millions for a thorough run) and over a tenth as many, under
+``tracemalloc``.  Peak memory and live blocks left behind per row are
+recorded as test properties (see ``--junitxml``), and so, for cases that
+hand rows back, are the blocks reheader allocates per row: every emitted
+row is kept alive and the traced blocks not allocated by this module are
+counted.
+"""
+
+import csv
+import gc
+import gzip
+import io
+import json
+import os
+import sys
+import tracemalloc
+
+import pytest
+import reheader.files
+from reheader import (reheadered, reheader_file, reheader_jsonl, load_sqlite,
+                      preflight, ConversionErrors, ValidationReport)
+
+ROWS = int(os.environ.get('REHEADER_MEMORY_ROWS', 50000))
+# peak memory may exceed the small run's by this factor plus slack...
+PEAK_GROWTH = 1.2
+PEAK_SLACK = 256 * 1024
+# ...and this many allocated blocks may be left behind per row
+RETAINED_BLOCKS_PER_ROW = 0.01
+
+HEADERS = ['name', 'email', 'zipcode']
+REGEX_HEADERS = {'name': None, 'email': r'\w+@\w+\.\w+', 'zipcode': None}
+
+
+def _dicts(count):
+    for n in range(count):
+        yield {'Name': 'Person {}'.format(n),
+               'e-mail': 'person{}@example.com'.format(n),
+               'zip': '{:05d}'.format(n % 100000)}
+
+
+def _lists(count):
+    yield ['Name', 'e-mail', 'zip']
+    for row in _dicts(count):
+        yield list(row.values())
+
+
+# while a list, _consume keeps the rows in it instead of dropping them
+_kept = None
+
+
+def _consume(rows):
+    if _kept is not None:
+        _kept.extend(rows)
+        return
+    for row in rows:
+        pass
+
+
+def _write_csv(path, count, compress=False):
+    opener = gzip.open if compress else io.open
+    with opener(path, 'wt', newline='') as outfile:
+        csv.writer(outfile).writerows(_lists(count))
+
+
+def _write_jsonl(path, count):
+    with io.open(path, 'w') as outfile:
+        for row in _dicts(count):
+            outfile.write(json.dumps(row) + '\n')
+
+
+# Each case is a generator: it prepares its input, yields, then runs.
+
+def _reheadered(count, tmpdir, headers=HEADERS, **kwargs):
+    yield
+    _consume(reheadered(_dicts(count), headers, **kwargs))
+
+
+def _reheadered_lists(count, tmpdir, headers=HEADERS, **kwargs):
+    yield
+    _consume(reheadered(_lists(count), headers, header_present=True,
+                        **kwargs))
+
+
+def _reheader_file(count, tmpdir, compress=False, **kwargs):
+    path = str(tmpdir.join('data.csv'))
+    _write_csv(path, count, compress)
+    yield
+    _consume(reheader_file(path, HEADERS, header_present=True, **kwargs))
+
+
+def _reheader_jsonl(count, tmpdir):
+    path = str(tmpdir.join('data.jsonl'))
+    _write_jsonl(path, count)
+    yield
+    reheader_jsonl(path, HEADERS, output=str(tmpdir.join('out.jsonl')))
+
+
+def _preflight(count, tmpdir):
+    path = str(tmpdir.join('data.csv'))
+    _write_csv(path, count)
+    yield
+    assert preflight(path, HEADERS).ok
+
+
+def _load_sqlite(count, tmpdir):
+    path = str(tmpdir.join('staging.db'))
+    if os.path.exists(path):
+        os.remove(path)
+    yield
+    load_sqlite(reheadered(_dicts(count), HEADERS), path, 'people', HEADERS,
+                batch_size=1000)
+
+
+# {name: (function, function returning keyword arguments for it)}
+CASES = {
+    'reheadered': (_reheadered, dict),
+    'reheadered_lists': (_reheadered_lists, dict),
+    'reheadered_view': (_reheadered, lambda: {'view': True}),
+    'reheadered_converters': (_reheadered, lambda: {
+        'converters': {'zipcode': int},
+        'conversion_errors': ConversionErrors()}),
+    'reheadered_validation': (_reheadered_lists, lambda: {
+        'headers': REGEX_HEADERS,
+        'validation': ValidationReport(every=10)}),
+    'reheader_file': (_reheader_file, dict),
+    'reheader_file_background': (_reheader_file, lambda: {
+        'compress': True, 'background': True, 'queue_size': 2}),
+    'reheader_file_checkpoint': (_reheader_file, lambda: {
+        'checkpoint_every': 1000}),
+    'reheader_jsonl': (_reheader_jsonl, dict),
+    'load_sqlite': (_load_sqlite, dict),
+    'preflight': (_preflight, dict),
+}
+
+
+def _prepare(case, count, tmpdir):
+    (function, kwargs) = CASES[case]
+    kwargs = kwargs()
+    if 'checkpoint_every' in kwargs:
+        kwargs['checkpoint'] = str(tmpdir.join('progress.json'))
+    run = function(count, tmpdir, **kwargs)
+    next(run)
+    return run
+
+
+def _measure(case, count, tmpdir):
+    """Peak traced bytes and allocated blocks left behind per row."""
+    run = _prepare(case, count, tmpdir)
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    try:
+        next(run, None)
+        gc.collect()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    retained = max(sys.getallocatedblocks() - blocks, 0)
+    return (peak, retained / float(count))
+
+
+def _allocated_per_row(case, count, tmpdir):
+    """Blocks allocated outside this module per emitted row, or None."""
+    global _kept
+    run = _prepare(case, count, tmpdir)
+    gc.collect()
+    _kept = []
+    tracemalloc.start()
+    try:
+        next(run, None)
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+        (kept, _kept) = (_kept, None)
+    if not kept:
+        return None
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, tracemalloc.__file__)])
+    blocks = sum(s.count for s in snapshot.statistics('filename'))
+    return blocks / float(len(kept))
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    # so that a tenth of the rows already fills several read chunks
+    monkeypatch.setattr(reheader.files, 'CHUNK_SIZE', 16 * 1024)
+
+
+@pytest.mark.parametrize('case', sorted(CASES))
+def test_memory_independent_of_row_count(case, tmpdir, small_chunks,
+                                         record_property):
+    _measure(case, ROWS // 100, tmpdir)  # warm caches and imports
+    (small_peak, _) = _measure(case, ROWS // 10, tmpdir)
+    (peak, retained) = _measure(case, ROWS, tmpdir)
+    record_property('peak_bytes_{}_rows'.format(ROWS // 10), small_peak)
+    record_property('peak_bytes_{}_rows'.format(ROWS), peak)
+    record_property('retained_blocks_per_row', retained)
+    allocated = _allocated_per_row(case, ROWS // 10, tmpdir)
+    if allocated is not None:
+        record_property('allocated_blocks_per_row', allocated)
+    assert peak <= small_peak * PEAK_GROWTH + PEAK_SLACK
+    assert retained <= RETAINED_BLOCKS_PER_ROW
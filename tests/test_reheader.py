@@ -12,7 +12,8 @@ import re
 from io import StringIO
 
 import pytest
-from reheader import reheadered
+from reheader import (reheadered, ConversionErrors, RowView, ValidationError,
+                      ValidationReport)
 
 _raw_txt_1 = u"""name,email,zip,
 Nellie Newsock,nellie@sox.com,45309,
@@ -281,7 +282,177 @@ class TestOptionalArgs(object):
         assert row['name'] == 'Nellie Newsock'
         assert row['email'] == 'nellie@sox.com'
 
+    def test_view(self):
+        for row in reheadered(_data(), ['name', 'email'], view=True):
+            assert isinstance(row, RowView)
+            assert sorted(row) == ['email', 'name']
+            assert 'zip' not in row
+        assert row['name'] == 'Ada Lovelace'
+        assert row['email'] == 'ada@maths.uk'
+
+    def test_view_matches_dicts(self):
+        headers = ['Name', 'mail', 'zipcode']
+        rows = list(reheadered(_data(), headers))
+        views = list(reheadered(_data(), headers, view=True))
+        assert [dict(v) for v in views] == rows
+
+    def test_view_list_of_lists(self):
+        data = _data(reader=csv.reader, with_headers=True)
+        headers = ['Name', 'mail', 'zipcode']
+        views = list(reheadered(data, headers, view=True))
+        assert [dict(v) for v in views] == list(reheadered(_data(), headers))
+
+    def test_view_is_read_only(self):
+        row = _next(reheadered(_data(), ['name', 'email'], view=True))
+        with pytest.raises(TypeError):
+            row['name'] = 'Nobody'
+
+    def test_fill_missing(self):
+        data = [{'name': 'Grace Hopper', 'email': 'grace@navy.mil'},
+                {'name': 'Ada Lovelace'}]
+        rows = list(reheadered(data, ['name', 'email'], fill_missing=True))
+        assert rows[1] == {'name': 'Ada Lovelace', 'email': None}
+        with pytest.raises(KeyError):
+            list(reheadered(data, ['name', 'email']))
+
+    def test_resolved_mapping_needs_required_columns(self):
+        resolved = {'mapping': {'name': 'name'}}
+        with pytest.raises(KeyError):
+            _next(reheadered(_data(), ['name', 'email'], resolved=resolved))
+
+    def test_view_rejects_converters(self):
+        with pytest.raises(ValueError):
+            _next(reheadered(_data(), ['name'], view=True,
+                             converters={'name': str.upper}))
+
     # form of data changes halfway through
     # sparse data - use regex when lines are blank
     # varying number of columns
     # non-string input
+
+
+class TestConverters(object):
+    def test_converters_applied(self):
+        headers = ['Name', 'mail', 'zipcode']
+        converters = {'Name': str.upper, 'mail': len}
+        row = _next(reheadered(_data(), headers, converters=converters))
+        assert row['Name'] == 'NELLIE NEWSOCK'
+        assert row['mail'] == len('nellie@sox.com')
+        assert row['zipcode'] == '45309'
+
+    def test_converters_list_of_lists(self):
+        data = _data(reader=csv.reader, with_headers=True)
+        headers = ['name', 'zip']
+        converters = {' zip ': lambda z: z[:5]}
+        zips = [r['zip'] for r in reheadered(data, headers,
+                                             converters=converters)]
+        assert zips == ['45309', '12345', '21401', '']
+
+    def test_conversion_error_raised(self):
+        with pytest.raises(ValueError):
+            list(reheadered(_data(), ['name', 'zip'],
+                            converters={'zip': int}))
+
+    def test_conversion_errors_collected(self):
+        errors = ConversionErrors()
+        rows = list(reheadered(_data(), ['name', 'zip'],
+                               converters={'zip': int},
+                               conversion_errors=errors))
+        assert [r['zip'] for r in rows] == [45309, None, 21401, None]
+        assert [r['name'] for r in rows][1] == 'Charles the Great'
+        assert errors.counts == {'zip': 2}
+        assert len(errors) == 2
+        assert errors.examples['zip'][0][0] == '12345-1234'
+
+    def test_conversion_examples_bounded(self):
+        errors = ConversionErrors(max_examples=1)
+        list(reheadered(_data(), ['name', 'zip'],
+                        converters={'zip': int},
+                        conversion_errors=errors))
+        assert errors.counts == {'zip': 2}
+        assert len(errors.examples['zip']) == 1
+
+    def test_unknown_converter_rejected(self):
+        with pytest.raises(ValueError):
+            _next(reheadered(_data(), ['name', 'zipcode'],
+                             converters={'zipp': int}))
+
+    def test_converter_for_extra_column(self):
+        rows = list(reheadered(_data(), ['name'], keep_extra=True,
+                               converters={'email': str.upper}))
+        assert rows[0]['email'] == 'NELLIE@SOX.COM'
+        with pytest.raises(ValueError):
+            _next(reheadered(_data(), ['name'], keep_extra=True,
+                             converters={'mail': str.upper}))
+
+    def test_short_list_row_raises_key_error(self):
+        data = csv.reader(StringIO(_raw_txt_2))
+        headers = ['zipcode', 'Name', 'e-mail', 'profession']
+        with pytest.raises(KeyError):
+            list(reheadered(data, headers, header_present=True))
+
+
+def _drifting_rows(count=1000, drift_at=500):
+    yield ['name', 'email']
+    for n in range(count):
+        email = 'person{}@example.com'.format(n)
+        if n >= drift_at:
+            email = 'unknown'
+        yield ['Person {}'.format(n), email]
+
+
+class TestValidation(object):
+    headers = {'name': None, 'email': r'^\w+@\w+\.\w+$'}
+
+    def test_every_nth_row(self):
+        report = ValidationReport(every=10)
+        rows = list(reheadered(_drifting_rows(), self.headers,
+                               header_present=True, validation=report))
+        assert len(rows) == 1000
+        assert report.rows_seen == 1000
+        assert report.rows_checked == 100
+        assert report.counts == {'email': 50}
+        assert report.mismatch_rate('email') == 0.5
+        assert report.examples['email'][0] == (510, 'unknown')
+        assert len(report.examples['email']) == 5
+
+    @pytest.mark.parametrize('kwargs', [
+        {'every': 0}, {'every': -5}, {'every': 2.5}, {'fraction': 0},
+        {'fraction': 1.5}, {'threshold': -0.1}, {'threshold': 2},
+        {'minimum_checked': -1}, {'max_examples': -1}])
+    def test_bad_arguments_rejected(self, kwargs):
+        with pytest.raises(ValueError):
+            ValidationReport(**kwargs)
+
+    def test_fraction(self):
+        report = ValidationReport(fraction=0.2, seed=1)
+        list(reheadered(_drifting_rows(), self.headers,
+                        header_present=True, validation=report))
+        assert 100 < report.rows_checked < 300
+        assert 0.3 < report.mismatch_rate('email') < 0.7
+
+    def test_blank_values_not_checked(self):
+        report = ValidationReport(every=1)
+        list(reheadered(_data(), {'name': None, 'zip': r'^\d{5}$'},
+                        validation=report))
+        assert report.rows_checked == 4
+        assert report.counts == {'zip': 1}
+        assert report.examples['zip'] == [(2, '12345-1234')]
+
+    def test_threshold_aborts(self):
+        report = ValidationReport(every=2, threshold=0.1, minimum_checked=50)
+        rows = reheadered(_drifting_rows(), self.headers,
+                          header_present=True, validation=report)
+        emitted = 0
+        with pytest.raises(ValidationError) as excinfo:
+            for row in rows:
+                emitted += 1
+        assert excinfo.value.report is report
+        assert 500 < emitted < 600
+        assert report.mismatch_rate('email') > 0.1
+
+    def test_threshold_not_reached(self):
+        report = ValidationReport(every=1, threshold=0.6)
+        rows = list(reheadered(_drifting_rows(), self.headers,
+                               header_present=True, validation=report))
+        assert len(rows) == 1000
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+test_sinks
+----------------------------------
+
+Tests for `reheader.sinks` module.
+"""
+
+import csv
+import sqlite3
+from io import StringIO
+
+import pytest
+from reheader import load_sqlite, reheadered
+
+_raw_txt = u"""name,email,zip
+Nellie Newsock,nellie@sox.com,45309
+Charles the Great,big_carl@roi.gouv.fr,12345-1234
+Grace Hopper,grace@navy.mil,21401
+Ada Lovelace,ada@maths.uk,
+"""
+
+
+def _rows(headers):
+    return reheadered(csv.DictReader(StringIO(_raw_txt)), headers)
+
+
+class TestLoadSqlite(object):
+    def setup_method(self, method):
+        self.connection = sqlite3.connect(':memory:')
+
+    def teardown_method(self, method):
+        self.connection.close()
+
+    def test_table_created_in_template_order(self):
+        headers = ['zipcode', 'Name', 'mail']
+        inserted = load_sqlite(_rows(headers), self.connection, 'people',
+                               headers, batch_size=3)
+        assert inserted == 4
+        cursor = self.connection.execute('SELECT * FROM people')
+        assert [d[0] for d in cursor.description] == headers
+        assert cursor.fetchall()[1] == ('12345-1234', 'Charles the Great',
+                                        'big_carl@roi.gouv.fr')
+
+    def test_dict_template(self):
+        headers = {'name': None, 'email': r'\w+@\w+\.\w+'}
+        load_sqlite(_rows(headers), self.connection, 'people', headers)
+        cursor = self.connection.execute('SELECT email FROM people')
+        assert cursor.fetchone() == ('nellie@sox.com', )
+
+    def test_missing_optional_column_null(self):
+        rows = [{'name': 'Grace Hopper'}]
+        load_sqlite(rows, self.connection, 'people', ['name', '?:email'])
+        cursor = self.connection.execute('SELECT name, email FROM people')
+        assert cursor.fetchall() == [('Grace Hopper', None)]
+
+    def test_missing_required_column_raises(self):
+        rows = [{'name': 'Grace Hopper'}]
+        with pytest.raises(KeyError):
+            load_sqlite(rows, self.connection, 'people', ['name', 'email'])
+
+    def test_open_transaction_refused(self):
+        self.connection.execute('CREATE TABLE log (entry)')
+        self.connection.execute("INSERT INTO log VALUES ('uncommitted')")
+        with pytest.raises(ValueError):
+            load_sqlite(_rows(['name']), self.connection, 'people', ['name'])
+        self.connection.rollback()
+        cursor = self.connection.execute('SELECT count(*) FROM log')
+        assert cursor.fetchone() == (0, )
+
+    def test_tuples(self):
+        rows = [('Nellie Newsock', 45309), ('Ada Lovelace', None)]
+        assert load_sqlite(rows, self.connection, 'people',
+                           ['name', 'zip']) == 2
+
+    def test_existing_table(self):
+        self.connection.execute(
+            'CREATE TABLE people (id INTEGER PRIMARY KEY, email, name)')
+        load_sqlite(_rows(['name', 'email']), self.connection, 'people',
+                    ['name', 'email'])
+        cursor = self.connection.execute('SELECT id, name FROM people')
+        assert cursor.fetchall()[-1] == (4, 'Ada Lovelace')
+
+    def test_existing_table_missing_column(self):
+        self.connection.execute('CREATE TABLE people (name)')
+        with pytest.raises(ValueError):
+            load_sqlite(_rows(['name', 'email']), self.connection, 'people',
+                        ['name', 'email'])
+
+    def test_database_path(self, tmpdir):
+        path = str(tmpdir.join('staging.db'))
+        load_sqlite(_rows(['name', 'email']), path, 'people',
+                    ['name', 'email'])
+        connection = sqlite3.connect(path)
+        count = connection.execute('SELECT count(*) FROM people').fetchone()
+        connection.close()
+        assert count == (4, )